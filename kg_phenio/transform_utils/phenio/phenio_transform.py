@@ -1,13 +1,18 @@
 """Transform for PHENIO."""
+import mmap
 import os
+import re
 import sys
-import tarfile
-from typing import Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Optional
 
 from kgx.cli.cli_utils import transform  # type: ignore
+from kgx.source import obograph_source  # type: ignore
 
 from kg_phenio.transform_utils.transform import Transform
 from kg_phenio.utils.robot_utils import initialize_robot, robot_convert
+from kg_phenio.utils.transform_utils import untar_to_dir
 
 ONTO_FILES = {
     "PhenioTransform": "phenio.owl",
@@ -15,21 +20,109 @@ ONTO_FILES = {
 
 QUERY_PATH = "kg_phenio/transform_utils/phenio/subq_construct.sparql"
 
+# Empty synonyms, xrefs, and comments.
+# These carry no information but break the transform to nodes/edges.
+OFFENDING_ELEMENTS = frozenset(
+    [
+        b"<oboInOwl:hasNarrowSynonym></oboInOwl:hasNarrowSynonym>",
+        b"<oboInOwl:hasBroadSynonym></oboInOwl:hasBroadSynonym>",
+        b"<oboInOwl:hasExactSynonym></oboInOwl:hasExactSynonym>",
+        b"<oboInOwl:hasRelatedSynonym></oboInOwl:hasRelatedSynonym>",
+        b"<oboInOwl:hasDbXref></oboInOwl:hasDbXref>",
+        b"<rdfs:comment></rdfs:comment>",
+    ]
+)
+
+# Lines consisting of nothing but one of the OFFENDING_ELEMENTS.
+OFFENDING_LINES = re.compile(
+    rb"^[ \t]*(?:"
+    + b"|".join(re.escape(element) for element in sorted(OFFENDING_ELEMENTS))
+    + rb")[ \t]*(?:\r?\n|\Z)",
+    re.MULTILINE,
+)
+
+# Most ROBOT conversions to run at once; each JVM may use a 12 GB heap.
+MAX_CONVERSIONS = 2
+
+# Size of the blocks read while scrubbing the OWL.
+SCRUB_BLOCK_SIZE = 1 << 22
+
+
+def remove_offending_lines(data_file: str) -> int:
+    """Remove any lines matching OFFENDING_LINES from an OWL file, in place.
+
+    The file is memory-mapped and processed in large blocks, each cut
+    at a newline so that lines are never split. Since lines are only
+    ever removed, each repaired block is written back over the file
+    behind the read position, and the file is truncated at the end.
+    A file with nothing to remove is never written to. Unlike writing
+    a copy and renaming it, this is not crash safe: if interrupted,
+    the OWL may be left partially repaired, with lines duplicated
+    past the write position, and should be extracted again.
+    :param data_file: OWL file to scrub
+    :return: number of lines removed
+    """
+    errors = 0
+    with open(data_file, "r+b") as owlfile:
+        size = os.fstat(owlfile.fileno()).st_size
+        if size == 0:
+            return errors
+        read_pos = write_pos = 0
+        with mmap.mmap(owlfile.fileno(), 0) as mm:
+            while read_pos < size:
+                end = min(read_pos + SCRUB_BLOCK_SIZE, size)
+                if end < size:
+                    cut = mm.rfind(b"\n", read_pos, end) + 1
+                    if cut <= read_pos:
+                        # No newline in this block, so read to the next one
+                        cut = mm.find(b"\n", end) + 1 or size
+                    end = cut
+                block, found = OFFENDING_LINES.subn(b"", mm[read_pos:end])
+                errors += found
+                # Nothing needs writing until the first removal
+                if write_pos != read_pos or found:
+                    mm[write_pos : write_pos + len(block)] = block
+                write_pos += len(block)
+                read_pos = end
+        if write_pos < size:
+            owlfile.truncate(write_pos)
+    return errors
+
 
 class PhenioTransform(Transform):
     """Parse the PHENIO OWL into nodes and edges."""
 
+    # ROBOT setups by path, shared by all instances
+    _robot_cache: Dict[str, list] = {}
+    _robot_lock = threading.Lock()
+
     def __init__(self, input_dir: str = "", output_dir: str = ""):
-        """Set defaults for PHENIO and set up ROBOT."""
+        """Set defaults for PHENIO.
+
+        ROBOT is only set up once it's needed.
+        """
         source_name = "phenio"
         super().__init__(source_name, input_dir, output_dir)
 
-        print("Setting up ROBOT...")
         self.robot_path = os.path.join(os.getcwd(), "robot")
-        self.robot_params = initialize_robot(self.robot_path)
-        print(f"ROBOT path: {self.robot_path}")
-        self.robot_env = self.robot_params[1]
-        print(f"ROBOT evironment variables: {self.robot_env['ROBOT_JAVA_ARGS']}")
+
+    @property
+    def robot_params(self) -> list:
+        """Get the ROBOT command and environment, setting up ROBOT if needed."""
+        with self._robot_lock:
+            if self.robot_path not in self._robot_cache:
+                print("Setting up ROBOT...")
+                robot_params = initialize_robot(self.robot_path)
+                print(f"ROBOT path: {self.robot_path}")
+                java_args = robot_params[1]["ROBOT_JAVA_ARGS"]
+                print(f"ROBOT evironment variables: {java_args}")
+                self._robot_cache[self.robot_path] = robot_params
+        return self._robot_cache[self.robot_path]
+
+    @property
+    def robot_env(self) -> dict:
+        """Get the environment variables to run ROBOT with."""
+        return self.robot_params[1]
 
     def run(self, data_file: Optional[str] = None) -> None:
         """Call transform and perform it.
@@ -45,13 +138,18 @@ class PhenioTransform(Transform):
             self.parse(k, data_file, k)
         else:
             # load all ontologies
-            for k in ONTO_FILES.keys():
-                data_file = os.path.join(self.input_base_dir, ONTO_FILES[k])
-                self.parse(k, data_file, k)
+            self.parse_all(
+                {
+                    k: os.path.join(self.input_base_dir, ONTO_FILES[k])
+                    for k in ONTO_FILES.keys()
+                }
+            )
 
     def parse(self, name: str, data_file: str, source: str) -> None:
         """Process the data_file.
 
+        A single ontology is converted and transformed in this thread,
+        as there's nothing to overlap it with.
         Args:
             name: Name of the ontology
             data_file: data file to parse
@@ -59,30 +157,128 @@ class PhenioTransform(Transform):
         Returns:
              None.
         """
+        self.check_ijson_backend()
+
+        data_file_json = self.make_obojson(data_file)
+        if not data_file_json:
+            sys.exit(f"Failed to convert {data_file}!")
+
+        self.transform_obojson(name, data_file_json)
+
+    def parse_all(self, data_files: Dict[str, str]) -> None:
+        """Process several data files as a pipeline.
+
+        Ontologies are repaired and converted to obojson in worker
+        threads, at most MAX_CONVERSIONS at once, and each is transformed
+        with KGX as soon as its obojson is ready, while the others are
+        still being repaired and converted.
+        Args:
+            data_files: dict of ontology names to data files to parse
+        Returns:
+             None.
+        """
+        if len(data_files) == 1:
+            ((name, data_file),) = data_files.items()
+            self.parse(name, data_file, name)
+            return
+
+        self.check_ijson_backend()
+
+        workers = min(len(data_files), MAX_CONVERSIONS)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(self.make_obojson, data_file): name
+                for name, data_file in data_files.items()
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                data_file_json = future.result()
+                if not data_file_json:
+                    # Don't start converting anything else; conversions
+                    # already running are still waited for on exit.
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    sys.exit(f"Failed to convert {data_files[name]}!")
+
+                self.transform_obojson(name, data_file_json)
+
+    @staticmethod
+    def check_ijson_backend() -> None:
+        """Report which ijson backend KGX will parse obojson with."""
+        # KGX streams obojson through ijson, which uses the fastest
+        # backend available; the pure Python one is many times slower.
+        ijson_backend = obograph_source.ijson.backend
+        print(f"Parsing obojson with the ijson {ijson_backend} backend.")
+        if ijson_backend == "python":
+            print(
+                "Warning: no compiled ijson backend found. "
+                "Install yajl for much faster obojson parsing."
+            )
+
+    def transform_obojson(self, name: str, data_file_json: str) -> None:
+        """Transform an obojson to KGX TSV nodes and edges.
+
+        Args:
+            name: Name of the ontology
+            data_file_json: obojson to transform
+        Returns:
+             None.
+        """
+        transform(
+            inputs=[data_file_json],
+            input_format="obojson",
+            output=os.path.join(self.output_dir, name),
+            output_format="tsv",
+            stream=True,
+        )
+
+    def make_obojson(self, data_file: str) -> Optional[str]:
+        """Prepare the data_file, then convert it to obojson.
+
+        Args:
+            data_file: data file to convert
+        Returns:
+            Path to the obojson, or None if conversion failed.
+        """
+        self.prepare(data_file)
+
+        data_file_json = os.path.splitext(data_file)[0] + ".json"
+
+        # The obojson is only rewritten if it's older than the ontology;
+        # KGX reads it more than once, so it can't be streamed instead.
+        if os.path.exists(data_file_json) and os.path.getmtime(
+            data_file_json
+        ) >= os.path.getmtime(data_file):
+            print(f"Found up to date obojson at {data_file_json}")
+            return data_file_json
+
+        # Convert to a temporary path first, so a failed or interrupted
+        # conversion never leaves a partial obojson that looks up to date.
+        # It keeps the .json suffix, since ROBOT picks the format from it.
+        data_file_json_tmp = os.path.splitext(data_file)[0] + ".tmp.json"
+        if not robot_convert(
+            robot_path=self.robot_path,
+            input_path=data_file,
+            output_path=data_file_json_tmp,
+            robot_env=self.robot_env,
+        ):
+            if os.path.exists(data_file_json_tmp):
+                os.remove(data_file_json_tmp)
+            return None
+        os.replace(data_file_json_tmp, data_file_json)
+        return data_file_json
+
+    def prepare(self, data_file: str) -> None:
+        """Decompress the data_file if needed, then repair it.
+
+        Args:
+            data_file: data file to prepare
+        Returns:
+             None.
+        """
         if not os.path.exists(data_file):
             if os.path.exists(data_file + ".tar.gz"):
                 print(f"Decompressing {data_file}")
-                with tarfile.open(data_file) as compfile:
-                    def is_within_directory(directory, target):
-                        
-                        abs_directory = os.path.abspath(directory)
-                        abs_target = os.path.abspath(target)
-                    
-                        prefix = os.path.commonprefix([abs_directory, abs_target])
-                        
-                        return prefix == abs_directory
-                    
-                    def safe_extract(tar, path=".", members=None, *, numeric_owner=False):
-                    
-                        for member in tar.getmembers():
-                            member_path = os.path.join(path, member.name)
-                            if not is_within_directory(path, member_path):
-                                raise Exception("Attempted Path Traversal in Tar File")
-                    
-                        tar.extractall(path, members, numeric_owner) 
-                        
-                    
-                    safe_extract(compfile, self.input_base_dir)
+                untar_to_dir(data_file + ".tar.gz", self.input_base_dir)
         else:
             print(f"Found ontology at {data_file}")
 
@@ -94,42 +290,7 @@ class PhenioTransform(Transform):
         # nodes/edges.
         # For now, this means removing empty synonyms, xrefs, and comments.
         print("Checking for errors...")
-        offending_lines = [
-            "<oboInOwl:hasNarrowSynonym></oboInOwl:hasNarrowSynonym>",
-            "<oboInOwl:hasBroadSynonym></oboInOwl:hasBroadSynonym>",
-            "<oboInOwl:hasExactSynonym></oboInOwl:hasExactSynonym>",
-            "<oboInOwl:hasRelatedSynonym></oboInOwl:hasRelatedSynonym>",
-            "<oboInOwl:hasDbXref></oboInOwl:hasDbXref>",
-            "<rdfs:comment></rdfs:comment>",
-        ]
-        data_file_tmp = data_file + ".tmp"
-        with open(data_file, "r") as infile:
-            with open(data_file_tmp, "w") as outfile:
-                linenum = 0
-                for line in infile:
-                    linenum = linenum + 1
-                    if line.strip() not in offending_lines:
-                        outfile.write(line)
-                    else:
-                        print(f"Found error at line {linenum}: {line.strip()}.")
-        os.replace(data_file_tmp, data_file)
-
-        # Convert to obojson.
-        data_file_json = os.path.splitext(data_file)[0] + ".json"
-
-        if not robot_convert(
-            robot_path=self.robot_path,
-            input_path=data_file,
-            output_path=data_file_json,
-            robot_env=self.robot_env,
-        ):
-            sys.exit(f"Failed to convert {data_file}!")
-
-        # Now do that transform.
-        transform(
-            inputs=[data_file_json],
-            input_format="obojson",
-            output=os.path.join(self.output_dir, name),
-            output_format="tsv",
-            stream=True,
-        )
+        # The ontology is only written to if there's something to remove,
+        # so an already clean ontology isn't treated as changed.
+        errors = remove_offending_lines(data_file)
+        print(f"Removed {errors} empty synonyms, xrefs, or comments.")
@@ -1,37 +1,64 @@
 """Koza ingest for Upheno phenotype maps."""
+import os
 import uuid
+from typing import Iterator
 
 from biolink_model_pydantic.model import Association, PhenotypicFeature
 from koza.cli_runner import get_koza_app
 
+# We just want mouse (MP) and human (HP) phenotypes.
+DESIRED_TYPES = frozenset(["MP", "HP"])
+
+PREDICATE = "biolink:same_as"
+RELATION = "skos:exactMatch"
+UUID_PREFIX = "uuid:"
+
+# Number of UUIDs to draw random bytes for at once.
+UUID_POOL_SIZE = 4096
+
+
+def pooled_uuid4s() -> Iterator[uuid.UUID]:
+    """Yield random (version 4) UUIDs, reading random bytes for many at a time."""
+    while True:
+        pool = os.urandom(16 * UUID_POOL_SIZE)
+        for start in range(0, len(pool), 16):
+            yield uuid.UUID(bytes=pool[start : start + 16], version=4)
+
+
 source_name = "upheno_mapping_all"
 koza_app = get_koza_app(source_name)
-row = koza_app.get_row()
+uuids = pooled_uuid4s()
 
-# We just want mouse (MP) and human (HP) phenotypes.
-desired_types = ["MP", "HP"]
-
-# Entities
-
-p1 = PhenotypicFeature(
-    id=(((row["p1"]).split("/"))[-1]).replace("_", ":"),
-    iri=row["p1"],
-    name=row["label_x"],
-)
-p2 = PhenotypicFeature(
-    id=(((row["p2"]).split("/"))[-1]).replace("_", ":"),
-    iri=row["p2"],
-    name=row["label_y"],
-)
-
-# Association
-if p1.id[0:2] in desired_types and p2.id[0:2] in desired_types:
+# This runs in Koza's loop mode, so this module is only
+# loaded once rather than reloaded for every row.
+for row in koza_app.source:
+    # Check prefixes before building any entities,
+    # as most rows are not MP/HP pairs.
+    p1_id = row["p1"].rsplit("/", 1)[-1].replace("_", ":")
+    p2_id = row["p2"].rsplit("/", 1)[-1].replace("_", ":")
+
+    if p1_id[0:2] not in DESIRED_TYPES or p2_id[0:2] not in DESIRED_TYPES:
+        continue
+
+    # Entities
+    p1 = PhenotypicFeature(
+        id=p1_id,
+        iri=row["p1"],
+        name=row["label_x"],
+    )
+    p2 = PhenotypicFeature(
+        id=p2_id,
+        iri=row["p2"],
+        name=row["label_y"],
+    )
+
+    # Association
     association = Association(
-        id="uuid:" + str(uuid.uuid1()),
+        id=UUID_PREFIX + str(next(uuids)),
         subject=p1.id,
-        predicate="biolink:same_as",
+        predicate=PREDICATE,
         object=p2.id,
-        relation="skos:exactMatch",
+        relation=RELATION,
     )
 
     koza_app.write(p1, association, p2)
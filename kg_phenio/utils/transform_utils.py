@@ -1,13 +1,50 @@
 """Provide utilities for aiding transformations."""
+import csv
 import gzip
+import io
 import logging
+import multiprocessing
 import os
 import re
 import shutil
+import tarfile
 import zipfile
-from typing import Any, Dict, List, Union
+from collections import deque
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Set, Union
 
-from tqdm import tqdm  # type: ignore
+# Read/write block size for bulk file copies and decompression.
+BUFFER_SIZE = 1 << 20
+
+# csv options for reading and writing KGX tsv as-is, without quote handling.
+KGX_TSV_FORMAT = {
+    "delimiter": "\t",
+    "quoting": csv.QUOTE_NONE,
+    "quotechar": None,
+    "lineterminator": "\n",
+}
+
+# Number of edge lines handed to each obsolete-filtering worker at once.
+EDGE_CHUNK_SIZE = 100_000
+
+# Progress is logged every 2**20 lines when reading large files.
+PROGRESS_INTERVAL_MASK = (1 << 20) - 1
+
+# Number of lines joined into each write by write_node_edge_items.
+WRITE_BATCH_SIZE = 10_000
+
+# Translation table dropping double quotes, for parse_header and parse_line.
+STRIP_QUOTES = str.maketrans("", "", '"')
+
+# Biolink categories by CURIE prefix, for guess_bl_category.
+PREFIX_CATEGORIES = {
+    "UniProtKB": "biolink:Protein",
+    "ComplexPortal": "biolink:Protein",
+    "GO": "biolink:OntologyClass",
+}
+
+# UniProtKB isoform CURIE, capturing the parent protein CURIE.
+UNIPROT_ISOFORM = re.compile(r"^(uniprotkb:.*?)-\d+$", re.IGNORECASE)
 
 
 class TransformError(Exception):
@@ -36,19 +73,17 @@ def multi_page_table_to_list(multi_page_table: Any) -> List[Dict]:
     Returns:
         table_data: A list of dicts, where each dict is item from one row.
     """
-    # iterate through data for each of 3 pages
-    table_data: List[Dict] = []
-
     header_items = get_header_items(multi_page_table[0])
 
-    for this_page in multi_page_table:
-        for row in this_page["data"]:
-            if len(row) != 4:
-                logging.warning("Unexpected number of rows in {}".format(row))
+    # flatten rows from all pages before building one dict per row
+    rows = [row for this_page in multi_page_table for row in this_page["data"]]
+    for row in rows:
+        if len(row) != 4:
+            logging.warning("Unexpected number of rows in {}".format(row))
 
-            items = [d["text"] for d in row]
-            this_dict = dict(zip(header_items, items))
-            table_data.append(this_dict)
+    table_data: List[Dict] = [
+        dict(zip(header_items, [d["text"] for d in row])) for row in rows
+    ]
 
     return table_data
 
@@ -68,7 +103,7 @@ def get_header_items(table_data: Any) -> List:
     return header_items
 
 
-def write_node_edge_item(fh: Any, header: List, data: List, sep: str = r"""\t"""):
+def write_node_edge_item(fh: Any, header: List, data: List, sep: str = "\t"):
     r"""Write out a single line for a node or an edge in *.tsv.
 
     :param fh: file handle of node or edge file
@@ -76,12 +111,41 @@ def write_node_edge_item(fh: Any, header: List, data: List, sep: str = r"""\t"""
     :param data: data for line to write out
     :param sep: separator [\t]
     """
-    if len(header) != len(data):
-        raise Exception("Header and data are not the same length.")
+    write_node_edge_items(fh, header, [data], sep)
+
+
+def write_node_edge_items(
+    fh: Any, header: List, data: Iterable[List], sep: str = "\t"
+):
+    r"""Write out many lines for nodes or edges in *.tsv.
+
+    Lines are joined and written in batches rather than one at a time.
+    :param fh: file handle of node or edge file
+    :param header: list of header items
+    :param data: data for each line to write out
+    :param sep: separator [\t]
+    """
+    batch: List[str] = []
+    for item in data:
+        if len(header) != len(item):
+            # Keep the output complete up to the bad line
+            if batch:
+                _write_lines(fh, batch)
+            raise Exception("Header and data are not the same length.")
+        batch.append(sep.join(item))
+        if len(batch) == WRITE_BATCH_SIZE:
+            _write_lines(fh, batch)
+            batch = []
+    if batch:
+        _write_lines(fh, batch)
+
+
+def _write_lines(fh: Any, lines: List[str]) -> None:
+    """Write lines to a file handle with a single write call."""
     try:
-        fh.write(sep.join(data) + "\n")
+        fh.write("\n".join(lines) + "\n")
     except IOError:
-        logging.warning("Can't write data for {}".format(data))
+        logging.warning("Can't write data for {}".format(lines))
 
 
 def get_item_by_priority(items_dict: dict, keys_by_priority: list) -> str:
@@ -125,10 +189,20 @@ def uniprot_make_name_to_id_mapping(dat_gz_file: str) -> dict:
     """
     name_to_id_map = dict()
     logging.info("Making uniprot name to id map")
-    with gzip.open(dat_gz_file, mode="rb") as file:
-        for line in tqdm(file):
-            items = line.decode().strip().split("\t")
-            name_to_id_map[items[2]] = items[0]
+    with gzip.open(dat_gz_file, mode="rb") as gz_file, io.BufferedReader(
+        gz_file, buffer_size=BUFFER_SIZE  # type: ignore
+    ) as file:
+        for line_count, line in enumerate(file, start=1):
+            if not line_count & PROGRESS_INTERVAL_MASK:
+                logging.info(f"Read {line_count} lines")
+            # Only the first and third fields are needed, so avoid
+            # decoding and splitting the whole line.
+            uniprot_id, _, rest = line.partition(b"\t")
+            name = rest.partition(b"\t")[2].partition(b"\t")[0].strip()
+            if not name:
+                # Malformed line without a name to map from
+                continue
+            name_to_id_map[name.decode()] = uniprot_id.strip().decode()
     return name_to_id_map
 
 
@@ -154,8 +228,7 @@ def parse_header(header_string: str, sep: str = "\t") -> List:
     Returns:
         A list of header items.
     """
-    header = header_string.strip().split(sep)
-    return [i.replace('"', "") for i in header]
+    return header_string.strip().translate(STRIP_QUOTES).split(sep)
 
 
 def parse_line(this_line: str, header_items: List, sep=",") -> Dict:
@@ -169,18 +242,42 @@ def parse_line(this_line: str, header_items: List, sep=",") -> Dict:
     Returns:
         item_dict: A dictionary of header items and a processed item from the dataset.
     """
-    data = this_line.strip().split(sep)
-    data = [i.replace('"', "") for i in data]
+    data = this_line.strip().translate(STRIP_QUOTES).split(sep)
 
     item_dict = data_to_dict(header_items, data)
 
     return item_dict
 
 
+def _safe_join(outdir: str, member_name: str) -> str:
+    """Get the extraction path for an archive member.
+
+    Raises TransformError if the member would land outside of outdir.
+    """
+    abs_outdir = os.path.abspath(outdir)
+    target = os.path.abspath(os.path.join(outdir, member_name))
+    if os.path.commonpath([abs_outdir, target]) != abs_outdir:
+        raise TransformError(f"Attempted Path Traversal in archive: {member_name}")
+    return target
+
+
 def unzip_to_tempdir(zip_file_name: str, tempdir: str) -> None:
-    """Unzip a zip file to a temp directory."""
+    """Unzip a zip file to a temp directory.
+
+    Members are copied out in large blocks, rather than
+    through ZipFile.extractall.
+    """
     with zipfile.ZipFile(zip_file_name, "r") as z:
-        z.extractall(tempdir)
+        for member in z.infolist():
+            target = _safe_join(tempdir, member.filename)
+            if member.is_dir():
+                os.makedirs(target, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with z.open(member) as zip_in, io.BufferedReader(
+                zip_in, buffer_size=BUFFER_SIZE  # type: ignore
+            ) as f_in, open(target, "wb") as f_out:
+                shutil.copyfileobj(f_in, f_out, length=BUFFER_SIZE)
 
 
 def ungzip_to_tempdir(gzipped_file: str, tempdir: str) -> str:
@@ -190,10 +287,35 @@ def ungzip_to_tempdir(gzipped_file: str, tempdir: str) -> str:
         ungzipped_file = os.path.splitext(ungzipped_file)[0]
 
     with gzip.open(gzipped_file, "rb") as f_in, open(ungzipped_file, "wb") as f_out:
-        shutil.copyfileobj(f_in, f_out)
+        shutil.copyfileobj(f_in, f_out, length=BUFFER_SIZE)
     return ungzipped_file
 
 
+def untar_to_dir(tar_gz_file: str, outdir: str) -> None:
+    """Extract a gzipped tar file to a directory.
+
+    The archive is streamed through a large read buffer and each
+    regular file is copied out in large blocks.
+    Members resolving outside of outdir are refused.
+    :param tar_gz_file: path to the .tar.gz file
+    :param outdir: directory to extract to
+    """
+    with gzip.open(tar_gz_file, "rb") as gz_in, io.BufferedReader(
+        gz_in, buffer_size=BUFFER_SIZE  # type: ignore
+    ) as buf_in, tarfile.open(fileobj=buf_in, mode="r|") as tar:
+        for member in tar:
+            target = _safe_join(outdir, member.name)
+            if member.isdir():
+                os.makedirs(target, exist_ok=True)
+            elif member.isfile():
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                f_in = tar.extractfile(member)
+                with f_in, open(target, "wb") as f_out:  # type: ignore
+                    shutil.copyfileobj(f_in, f_out, length=BUFFER_SIZE)
+            else:
+                logging.warning(f"Skipping non-regular tar member {member.name}")
+
+
 def guess_bl_category(identifier: str) -> str:
     """Guess category for a given identifier.
 
@@ -203,14 +325,8 @@ def guess_bl_category(identifier: str) -> str:
     Returns:
         The category for the given CURIE
     """
-    prefix = identifier.split(":")[0]
-    if prefix in {"UniProtKB", "ComplexPortal"}:
-        category = "biolink:Protein"
-    elif prefix in {"GO"}:
-        category = "biolink:OntologyClass"
-    else:
-        category = "biolink:NamedThing"
-    return category
+    prefix = identifier.partition(":")[0]
+    return PREFIX_CATEGORIES.get(prefix, "biolink:NamedThing")
 
 
 def collapse_uniprot_curie(uniprot_curie: str) -> str:
@@ -222,12 +338,31 @@ def collapse_uniprot_curie(uniprot_curie: str) -> str:
     :param uniprot_curie:
     :return: collapsed UniProtKB ID
     """
-    if re.match(r"^uniprotkb:", uniprot_curie, re.IGNORECASE):
-        uniprot_curie = re.sub(r"\-\d+$", "", uniprot_curie)
-    return uniprot_curie
+    return UNIPROT_ISOFORM.sub(r"\1", uniprot_curie)
+
+
+_obsolete_nodes: Set[str] = set()
+
+
+def _init_obsolete_filter(obsolete_nodes: Set[str]) -> None:
+    """Set the obsolete node IDs for this worker process."""
+    global _obsolete_nodes
+    _obsolete_nodes = obsolete_nodes
+
+
+def _filter_obsolete_edges(lines: List[str]) -> str:
+    """Join the KGX tsv edge lines not involving an obsolete node."""
+    kept = []
+    for line in lines:
+        fields = line.rstrip("\r\n").split("\t", 4)
+        if fields[1] not in _obsolete_nodes and fields[3] not in _obsolete_nodes:
+            kept.append(line)
+    return "".join(kept)
 
 
-def remove_obsoletes(nodepath: str, edgepath: str) -> None:
+def remove_obsoletes(
+    nodepath: str, edgepath: str, processes: Optional[int] = None
+) -> None:
     """
     Remove obsolete nodes and related edges.
 
@@ -242,49 +377,62 @@ def remove_obsoletes(nodepath: str, edgepath: str) -> None:
 
     :param nodepath: str, path to the node file
     :param edgepath: str, path to the edge file
+    :param processes: int, number of processes to filter edges with,
+    defaults to the number of CPUs
     """
     outnodepath = nodepath + ".tmp"
     outedgepath = edgepath + ".tmp"
 
-    obsolete_nodes = []
+    obsolete_nodes: Set[str] = set()
 
     try:
-        with open(nodepath, "r") as innodefile, open(edgepath, "r") as inedgefile:
-            with open(outnodepath, "w") as outnodefile, open(
-                outedgepath, "w"
+        # First pass: collect obsolete node IDs from names and edges
+        with open(nodepath, "r", newline="", buffering=BUFFER_SIZE) as innodefile:
+            for row in csv.reader(innodefile, **KGX_TSV_FORMAT):
+                if row[2].lower().startswith("obsolete"):
+                    obsolete_nodes.add(row[0])
+        with open(edgepath, "r", newline="", buffering=BUFFER_SIZE) as inedgefile:
+            for row in csv.reader(inedgefile, **KGX_TSV_FORMAT):
+                if row[5] == "IAO:0100001" or row[3] == "OIO:ObsoleteClass":
+                    obsolete_nodes.add(row[1])
+
+        # Second pass: write everything not involving an obsolete node.
+        # Edges are filtered in chunks across worker processes,
+        # keeping only a few chunks in flight at a time.
+        processes = processes or os.cpu_count() or 1
+        with open(edgepath, "r", newline="", buffering=BUFFER_SIZE) as inedgefile:
+            with open(
+                outedgepath, "w", newline="", buffering=BUFFER_SIZE
             ) as outedgefile:
-                for line in innodefile:
-                    line_split = (line.rstrip()).split("\t")
-                    if (line_split[2].lower()).startswith("obsolete"):
-                        # collect the obsolete node ID so we
-                        # can remove its edges too
-                        obsolete_nodes.append(line_split[0])
-                        continue
-                for line in inedgefile:
-                    line_split = (line.rstrip()).split("\t")
-                    if (
-                        line_split[1] in obsolete_nodes
-                        or line_split[3] in obsolete_nodes
-                    ):
-                        continue
-                    elif (
-                        line_split[5] == "IAO:0100001"
-                        or line_split[3] == "OIO:ObsoleteClass"
-                    ):
-                        obsolete_nodes.append(line_split[1])
-                        continue
-                    else:
-                        outedgefile.write("\t".join(line_split) + "\n")
-                # Iterate over the nodefile one more time,
-                # in case the edges told us anything new
-                innodefile.seek(0)
-                for line in innodefile:
-                    line_split = (line.rstrip()).split("\t")
-                    if line_split[0] in obsolete_nodes:
-                        continue
-                    else:
-                        outnodefile.write("\t".join(line_split) + "\n")
+                chunks = iter(lambda: list(islice(inedgefile, EDGE_CHUNK_SIZE)), [])
+                if processes == 1:
+                    _init_obsolete_filter(obsolete_nodes)
+                    outedgefile.writelines(map(_filter_obsolete_edges, chunks))
+                else:
+                    with multiprocessing.Pool(
+                        processes,
+                        initializer=_init_obsolete_filter,
+                        initargs=(obsolete_nodes,),
+                    ) as pool:
+                        pending: deque = deque()
+                        for chunk in chunks:
+                            pending.append(
+                                pool.apply_async(_filter_obsolete_edges, (chunk,))
+                            )
+                            if len(pending) > 2 * processes:
+                                outedgefile.write(pending.popleft().get())
+                        while pending:
+                            outedgefile.write(pending.popleft().get())
+        with open(nodepath, "r", newline="", buffering=BUFFER_SIZE) as innodefile:
+            with open(
+                outnodepath, "w", newline="", buffering=BUFFER_SIZE
+            ) as outnodefile:
+                csv.writer(outnodefile, **KGX_TSV_FORMAT).writerows(
+                    row
+                    for row in csv.reader(innodefile, **KGX_TSV_FORMAT)
+                    if row[0] not in obsolete_nodes
+                )
         os.replace(outnodepath, nodepath)
         os.replace(outedgepath, edgepath)
-    except (IOError, KeyError) as e:
+    except (IOError, KeyError, csv.Error) as e:
         print(f"Failed to remove obsoletes from {nodepath} and {edgepath}: {e}")
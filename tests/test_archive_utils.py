@@ -0,0 +1,85 @@
+"""Test functions for extracting archives."""
+import io
+import os
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+from kg_phenio.utils.transform_utils import (TransformError, untar_to_dir,
+                                             unzip_to_tempdir)
+
+
+class TestArchiveUtils(unittest.TestCase):
+    """Test class for archive extraction utils."""
+
+    def setUp(self) -> None:
+        """Set up a temp directory for archives and their contents."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.outdir = os.path.join(self.tmpdir.name, "out")
+        os.makedirs(self.outdir)
+
+    def make_tar_gz(self, members) -> str:
+        """Write a .tar.gz of (name, contents or None for a symlink) pairs."""
+        path = os.path.join(self.tmpdir.name, "test.tar.gz")
+        with tarfile.open(path, "w:gz") as tar:
+            for name, contents in members:
+                info = tarfile.TarInfo(name)
+                if contents is None:
+                    info.type = tarfile.SYMTYPE
+                    info.linkname = "/etc/passwd"
+                    tar.addfile(info)
+                else:
+                    info.size = len(contents)
+                    tar.addfile(info, io.BytesIO(contents))
+        return path
+
+    def make_zip(self, members) -> str:
+        """Write a .zip of (name, contents) pairs."""
+        path = os.path.join(self.tmpdir.name, "test.zip")
+        with zipfile.ZipFile(path, "w") as z:
+            for name, contents in members:
+                z.writestr(name, contents)
+        return path
+
+    def read(self, *parts) -> bytes:
+        """Read an extracted file."""
+        with open(os.path.join(self.outdir, *parts), "rb") as f:
+            return f.read()
+
+    def test_untar_to_dir(self):
+        """Test extracting a tar.gz."""
+        path = self.make_tar_gz([("phenio.owl", b"<owl/>"), ("sub/a.txt", b"a")])
+        untar_to_dir(path, self.outdir)
+        self.assertEqual(b"<owl/>", self.read("phenio.owl"))
+        self.assertEqual(b"a", self.read("sub", "a.txt"))
+
+    def test_untar_to_dir_path_traversal(self):
+        """Test that a tar.gz member outside the target dir is refused."""
+        path = self.make_tar_gz([("../evil", b"x")])
+        with self.assertRaises(TransformError):
+            untar_to_dir(path, self.outdir)
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir.name, "evil")))
+
+    def test_untar_to_dir_skips_symlink(self):
+        """Test that a symlink in a tar.gz is skipped, not extracted."""
+        path = self.make_tar_gz([("link", None), ("phenio.owl", b"<owl/>")])
+        with self.assertLogs(level="WARNING"):
+            untar_to_dir(path, self.outdir)
+        self.assertFalse(os.path.lexists(os.path.join(self.outdir, "link")))
+        self.assertEqual(b"<owl/>", self.read("phenio.owl"))
+
+    def test_unzip_to_tempdir(self):
+        """Test extracting a zip."""
+        path = self.make_zip([("phenio.owl", b"<owl/>"), ("sub/a.txt", b"a")])
+        unzip_to_tempdir(path, self.outdir)
+        self.assertEqual(b"<owl/>", self.read("phenio.owl"))
+        self.assertEqual(b"a", self.read("sub", "a.txt"))
+
+    def test_unzip_to_tempdir_path_traversal(self):
+        """Test that a zip member outside the target dir is refused."""
+        path = self.make_zip([("../evil", b"x")])
+        with self.assertRaises(TransformError):
+            unzip_to_tempdir(path, self.outdir)
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir.name, "evil")))
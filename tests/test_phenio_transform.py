@@ -0,0 +1,211 @@
+"""Test functions for the PHENIO transform."""
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from parameterized import parameterized
+
+from kg_phenio.transform_utils.phenio.phenio_transform import (
+    PhenioTransform,
+    remove_offending_lines,
+)
+
+MODULE = "kg_phenio.transform_utils.phenio.phenio_transform"
+
+EMPTY_XREF = b"<oboInOwl:hasDbXref></oboInOwl:hasDbXref>"
+EMPTY_COMMENT = b"<rdfs:comment></rdfs:comment>"
+
+SCRUB_CASES = [
+    ("empty", b"", b"", 0),
+    (
+        "straddling",
+        b"<a>\n    " + EMPTY_XREF + b"\n  " + EMPTY_COMMENT + b"\n<b>\n",
+        b"<a>\n<b>\n",
+        2,
+    ),
+    (
+        "crlf",
+        b"<a>\r\n  " + EMPTY_XREF + b"\r\n<b>\r\n",
+        b"<a>\r\n<b>\r\n",
+        1,
+    ),
+    (
+        "no_final_newline",
+        b"<a>\n<b>\n\t" + EMPTY_COMMENT,
+        b"<a>\n<b>\n",
+        1,
+    ),
+    (
+        "kept_with_text",
+        b"<a>\n" + EMPTY_XREF + b" <c/>\n" + EMPTY_XREF + b"\n",
+        b"<a>\n" + EMPTY_XREF + b" <c/>\n",
+        1,
+    ),
+]
+
+
+class TestRemoveOffendingLines(unittest.TestCase):
+    """Test class for scrubbing empty elements from PHENIO in place."""
+
+    def scrub(self, contents: bytes, block_size: int):
+        """Scrub a file with the given contents using small blocks."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "phenio.owl")
+            with open(path, "wb") as f:
+                f.write(contents)
+            os.utime(path, (0, 0))
+            with mock.patch(f"{MODULE}.SCRUB_BLOCK_SIZE", block_size):
+                errors = remove_offending_lines(path)
+            with open(path, "rb") as f:
+                return errors, f.read(), os.path.getmtime(path)
+
+    @parameterized.expand(
+        [
+            (f"{name}_{block_size}", contents, expected, errors, block_size)
+            for name, contents, expected, errors in SCRUB_CASES
+            for block_size in (1, 5, 1 << 22)
+        ]
+    )
+    def test_remove_offending_lines(
+        self, name, contents, expected, expected_errors, block_size
+    ):
+        """Test removing offending lines, whatever the block boundaries."""
+        errors, scrubbed, _ = self.scrub(contents, block_size)
+        self.assertEqual(expected, scrubbed)
+        self.assertEqual(expected_errors, errors)
+
+    @parameterized.expand([(1,), (5,)])
+    def test_clean_file_is_not_written(self, block_size):
+        """Test that a file with nothing to remove is left untouched."""
+        contents = b"<a>\n  " + EMPTY_XREF + b" <c/>\r\n<b>"
+        errors, scrubbed, mtime = self.scrub(contents, block_size)
+        self.assertEqual(0, errors)
+        self.assertEqual(contents, scrubbed)
+        self.assertEqual(0, mtime)
+
+
+class TestMakeObojson(unittest.TestCase):
+    """Test class for converting PHENIO to obojson, or reusing it."""
+
+    def setUp(self) -> None:
+        """Set up an ontology and a transform that never sets up ROBOT."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.data_file = os.path.join(self.tmpdir.name, "phenio.owl")
+        self.data_file_json = os.path.join(self.tmpdir.name, "phenio.json")
+        self.data_file_json_tmp = os.path.join(self.tmpdir.name, "phenio.tmp.json")
+        with open(self.data_file, "w") as f:
+            f.write("<owl/>\n")
+
+        robot_env = mock.patch.object(
+            PhenioTransform, "robot_env", new_callable=mock.PropertyMock
+        )
+        robot_env.start().return_value = {}
+        self.addCleanup(robot_env.stop)
+
+        self.transform = PhenioTransform(
+            input_dir=self.tmpdir.name, output_dir=self.tmpdir.name
+        )
+
+    def write_json(self, mtime_offset: int) -> None:
+        """Write an existing obojson, offset in time from the ontology."""
+        with open(self.data_file_json, "w") as f:
+            f.write("old")
+        owl_mtime = os.path.getmtime(self.data_file)
+        os.utime(self.data_file_json, (owl_mtime, owl_mtime + mtime_offset))
+
+    def test_newer_obojson_skips_robot(self):
+        """Test that an obojson newer than the ontology is reused."""
+        self.write_json(mtime_offset=10)
+        with mock.patch(f"{MODULE}.robot_convert") as robot_convert:
+            result = self.transform.make_obojson(self.data_file)
+        robot_convert.assert_not_called()
+        self.assertEqual(self.data_file_json, result)
+
+    def test_older_obojson_is_converted(self):
+        """Test that an obojson older than the ontology is rebuilt."""
+        self.write_json(mtime_offset=-10)
+
+        def convert(robot_path, input_path, output_path, robot_env):
+            with open(output_path, "w") as f:
+                f.write("new")
+            return True
+
+        with mock.patch(
+            f"{MODULE}.robot_convert", side_effect=convert
+        ) as robot_convert:
+            result = self.transform.make_obojson(self.data_file)
+        robot_convert.assert_called_once()
+        self.assertEqual(
+            self.data_file_json_tmp, robot_convert.call_args.kwargs["output_path"]
+        )
+        self.assertEqual(self.data_file_json, result)
+        with open(self.data_file_json) as f:
+            self.assertEqual("new", f.read())
+        self.assertFalse(os.path.exists(self.data_file_json_tmp))
+
+    def test_failed_conversion_leaves_no_obojson(self):
+        """Test that a failed conversion leaves no obojson, partial or not."""
+
+        def convert(robot_path, input_path, output_path, robot_env):
+            with open(output_path, "w") as f:
+                f.write("truncat")
+            return False
+
+        with mock.patch(f"{MODULE}.robot_convert", side_effect=convert):
+            result = self.transform.make_obojson(self.data_file)
+        self.assertIsNone(result)
+        self.assertFalse(os.path.exists(self.data_file_json))
+        self.assertFalse(os.path.exists(self.data_file_json_tmp))
+
+
+class TestParseAll(unittest.TestCase):
+    """Test class for converting and transforming several ontologies."""
+
+    def setUp(self) -> None:
+        """Set up a transform and the data files to parse."""
+        self.transform = PhenioTransform(input_dir="input", output_dir="output")
+        self.data_files = {name: f"{name}.owl" for name in "abcd"}
+
+    def test_single_ontology_skips_executor(self):
+        """Test that one ontology is converted without worker threads."""
+        with mock.patch(f"{MODULE}.ThreadPoolExecutor") as executor, mock.patch(
+            f"{MODULE}.transform"
+        ) as transform, mock.patch.object(
+            self.transform, "make_obojson", return_value="a.json"
+        ) as make_obojson:
+            self.transform.parse_all({"a": "a.owl"})
+        executor.assert_not_called()
+        make_obojson.assert_called_once_with("a.owl")
+        transform.assert_called_once()
+        self.assertEqual(["a.json"], transform.call_args.kwargs["inputs"])
+
+    def test_failed_conversion_stops_pipeline(self):
+        """Test that a failed conversion stops any more from starting."""
+        release = threading.Event()
+
+        def make_obojson(data_file):
+            if data_file == "a.owl":
+                return None
+            # Keep both workers busy until the pipeline has stopped
+            release.wait(10)
+            return data_file.replace(".owl", ".json")
+
+        def exit(message):
+            release.set()
+            raise SystemExit(message)
+
+        with mock.patch(f"{MODULE}.MAX_CONVERSIONS", 2), mock.patch(
+            f"{MODULE}.transform"
+        ) as transform, mock.patch(f"{MODULE}.sys") as mock_sys, mock.patch.object(
+            self.transform, "make_obojson", side_effect=make_obojson
+        ) as mock_make_obojson:
+            mock_sys.exit.side_effect = exit
+            with self.assertRaises(SystemExit) as cm:
+                self.transform.parse_all(self.data_files)
+        self.assertEqual("Failed to convert a.owl!", cm.exception.code)
+        transform.assert_not_called()
+        converted = [call.args[0] for call in mock_make_obojson.call_args_list]
+        self.assertNotIn("d.owl", converted)
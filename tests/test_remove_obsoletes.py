@@ -1,5 +1,6 @@
 """Test functions for removing obsolete nodes/edges."""
 import os
+import tempfile
 import unittest
 
 from kg_phenio.utils.transform_utils import remove_obsoletes
@@ -44,3 +45,35 @@ class TestRemoveObsoletes(unittest.TestCase):
 
         self.assertLess(post_node_size, pre_node_size)
         self.assertLess(post_edge_size, pre_edge_size)
+
+    def test_remove_edges_of_later_obsolete_nodes(self):
+        """Test removing edges of nodes only found obsolete later in the edges."""
+        nodes = (
+            "id\tcategory\tname\n"
+            "OBO:A\tbiolink:NamedThing\tCut the mustard\n"
+            "OBO:B\tbiolink:NamedThing\tTake the cake\n"
+            "OBO:C\tbiolink:NamedThing\tSalad days\n"
+        )
+        edges = (
+            "id\tsubject\tpredicate\tobject\tcategory\trelation\n"
+            "e1\tOBO:A\tbiolink:subclass_of\tOBO:B\t\trdfs:subClassOf\n"
+            "e2\tOBO:C\tbiolink:subclass_of\tOBO:A\t\trdfs:subClassOf\n"
+            "e3\tOBO:B\tbiolink:subclass_of\tOBO:C\t\tIAO:0100001\n"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            nodepath = os.path.join(tmpdir, "nodes.tsv")
+            edgepath = os.path.join(tmpdir, "edges.tsv")
+            with open(nodepath, "w") as nodefile:
+                nodefile.write(nodes)
+            with open(edgepath, "w") as edgefile:
+                edgefile.write(edges)
+
+            remove_obsoletes(nodepath, edgepath)
+
+            with open(nodepath) as nodefile:
+                node_ids = [line.split("\t")[0] for line in nodefile]
+            with open(edgepath) as edgefile:
+                edge_ids = [line.split("\t")[0] for line in edgefile]
+
+        self.assertEqual(node_ids, ["id", "OBO:A", "OBO:C"])
+        self.assertEqual(edge_ids, ["id", "e2"])
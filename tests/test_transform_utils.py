@@ -1,10 +1,17 @@
 """Test the category and CURIE parser utils."""
+import gzip
+import io
+import os
+import tempfile
 import unittest
 
 from parameterized import parameterized
 
 from kg_phenio.utils.transform_utils import (collapse_uniprot_curie,
-                                             guess_bl_category)
+                                             guess_bl_category,
+                                             uniprot_make_name_to_id_mapping,
+                                             write_node_edge_item,
+                                             write_node_edge_items)
 
 
 class TestTransformUtils(unittest.TestCase):
@@ -34,3 +41,45 @@ class TestTransformUtils(unittest.TestCase):
     def test_collapse_uniprot_curie(self, curie, collapsed_curie):
         """Test collapsing Uniprot protein CURIEs."""
         self.assertEqual(collapsed_curie, collapse_uniprot_curie(curie))
+
+    def test_write_node_edge_item(self):
+        """Test writing a single tab-separated node line."""
+        fh = io.StringIO()
+        write_node_edge_item(fh, ["id", "name"], ["GO:1", "thing"])
+        self.assertEqual("GO:1\tthing\n", fh.getvalue())
+
+    def test_write_node_edge_items(self):
+        """Test writing many tab-separated node lines."""
+        fh = io.StringIO()
+        write_node_edge_items(fh, ["id", "name"], [["GO:1", "a"], ["GO:2", "b"]])
+        self.assertEqual("GO:1\ta\nGO:2\tb\n", fh.getvalue())
+
+    def test_write_node_edge_items_length_mismatch(self):
+        """Test that a line not matching the header isn't written."""
+        fh = io.StringIO()
+        with self.assertRaises(Exception):
+            write_node_edge_items(fh, ["id", "name"], [["GO:1"]])
+        self.assertEqual("", fh.getvalue())
+
+    def test_write_node_edge_items_length_mismatch_after_good_lines(self):
+        """Test that lines before one not matching the header are written."""
+        fh = io.StringIO()
+        with self.assertRaises(Exception):
+            write_node_edge_items(
+                fh, ["id", "name"], [["GO:1", "a"], ["GO:2", "b"], ["GO:3"]]
+            )
+        self.assertEqual("GO:1\ta\nGO:2\tb\n", fh.getvalue())
+
+    def test_uniprot_make_name_to_id_mapping(self):
+        """Test mapping Uniprot names to IDs, skipping lines without a name."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            dat_gz_file = os.path.join(tmpdir, "idmapping.dat.gz")
+            with gzip.open(dat_gz_file, "wb") as f:
+                f.write(
+                    b"P1\tUniProtKB-ID\tA_HUMAN\n"
+                    b"P2\tGene_Name\tB\r\n"
+                    b"P3\tshort\n"
+                    b"P4\tempty\t\n"
+                )
+            name_to_id_map = uniprot_make_name_to_id_mapping(dat_gz_file)
+        self.assertEqual({"A_HUMAN": "P1", "B": "P2"}, name_to_id_map)